@@ -6,23 +6,20 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import bcrypt
-import jwt
 from datetime import datetime, timedelta
 import base64
+import functools
+import html
 import io
 import time
+import threading
+import weakref
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-# Import Twilio (optional - will work without it)
-try:
-    from twilio.rest import Client as TwilioClient
-    TWILIO_AVAILABLE = True
-except ImportError:
-    TWILIO_AVAILABLE = False
+# Twilio is optional - it is imported on first use, so only probe for it here
+TWILIO_AVAILABLE = importlib.util.find_spec("twilio") is not None
 
 # Import os for environment variables
 import os
@@ -45,7 +42,7 @@ st.set_page_config(
 )
 
 # Custom CSS to completely hide Streamlit branding and create professional UI
-st.markdown("""
+APP_CSS = """
 <style>
     /* Hide all Streamlit branding */
     #MainMenu {visibility: hidden;}
@@ -188,20 +185,72 @@ st.markdown("""
         font-size: 1.1rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 # ============================================================================
 # SMS NOTIFICATION SYSTEM
 # ============================================================================
 
+# Risk alert body; only the member, level and days vary between messages
+_RISK_MSG_TMPL = "🚨 SIMLANE ALERT: Member {mid} is at {rl} risk of churning in {d} days. Take action now!".format
+_TEST_MSG = "🎯 Simlane.ai Test Message: Your SMS notifications are working correctly!"
+
+# Friendly messages for common Twilio error codes
+_TWILIO_ERROR_MESSAGES = {
+    21211: "Invalid phone number. Please use E.164 format, e.g. +15551234567.",
+    21606: "The configured 'from' number is not a valid Twilio number for this account.",
+    30032: "The toll-free 'from' number has not been verified yet."
+}
+
+# Setup instructions shown when a test SMS fails
+_TWILIO_HELP_MD = """
+**To configure Twilio:**
+
+1. Create a `.streamlit/secrets.toml` file:
+```toml
+[twilio]
+account_sid = "your-account-sid"
+auth_token = "your-auth-token"
+from_number = "+1234567890"
+```
+
+2. Or set environment variables:
+```bash
+export TWILIO_ACCOUNT_SID="your-sid"
+export TWILIO_AUTH_TOKEN="your-token"
+export TWILIO_FROM_NUMBER="+1234567890"
+```
+
+3. Get your credentials from [Twilio Console](https://console.twilio.com)
+"""
+
 class SMSManager:
+    # Bulk sends run on a small worker pool. A semaphore caps in-flight Twilio
+    # calls and a token bucket keeps bulk sends under Twilio's per-number rate
+    # while letting a short burst go out at once. Throttled sends pause the
+    # bucket for their backoff instead of sleeping on top of it.
+    MAX_WORKERS = 4
+    SEND_RATE = 1.0
+    SEND_BURST = 4
+    MAX_RETRIES = 3
+    MAX_BACKOFF = 30
+    
     def __init__(self):
         self.client = None
         self.from_number = None
+        self.init_error = None
+        self._executor = None
+        self._in_flight = threading.Semaphore(self.MAX_WORKERS)
+        self._rate_lock = threading.Lock()
+        self._tokens = float(self.SEND_BURST)
+        self._tokens_at = time.monotonic()
+        self._paused_until = 0.0
         
         # Try to initialize Twilio client if credentials are available
         if TWILIO_AVAILABLE:
             try:
+                from twilio.rest import Client as TwilioClient
+                
                 # Check for Twilio credentials in Streamlit secrets
                 if 'twilio' in st.secrets:
                     account_sid = st.secrets['twilio']['account_sid']
@@ -210,66 +259,133 @@ class SMSManager:
                     self.client = TwilioClient(account_sid, auth_token)
                 # Check environment variables as fallback
                 elif all(k in os.environ for k in ['TWILIO_ACCOUNT_SID', 'TWILIO_AUTH_TOKEN']):
-                    import os
                     account_sid = os.environ['TWILIO_ACCOUNT_SID']
                     auth_token = os.environ['TWILIO_AUTH_TOKEN']
                     self.from_number = os.environ.get('TWILIO_FROM_NUMBER', '+1234567890')
                     self.client = TwilioClient(account_sid, auth_token)
             except Exception as e:
-                st.error(f"Failed to initialize Twilio: {str(e)}")
+                self.init_error = f"Failed to initialize Twilio: {str(e)}"
+        
+        if self.client:
+            self._executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
+            weakref.finalize(self, self._executor.shutdown, wait=False)
     
-    def send_sms(self, to_number, message):
-        """Send an SMS message using Twilio."""
+    def send_sms(self, to_number, message, rate_limited=False):
+        """Send an SMS message using Twilio; bulk sends draw from the shared rate limit."""
         if not self.client:
-            return False, "Twilio client not initialized. Please configure credentials."
+            return False, self.init_error or "Twilio client not initialized. Please configure credentials."
         
-        try:
-            message = self.client.messages.create(
-                body=message,
-                from_=self.from_number,
-                to=to_number
-            )
-            return True, f"Message sent successfully! SID: {message.sid}"
-        except Exception as e:
-            return False, f"Failed to send SMS: {str(e)}"
+        from twilio.base.exceptions import TwilioRestException
+        
+        backoff = 1
+        for attempt in range(self.MAX_RETRIES + 1):
+            if rate_limited:
+                self._acquire_send_token()
+            try:
+                with self._in_flight:
+                    message = self.client.messages.create(
+                        body=message,
+                        from_=self.from_number,
+                        to=to_number
+                    )
+                return True, f"Message sent successfully! SID: {message.sid}"
+            except TwilioRestException as e:
+                if (e.status == 429 or e.code == 20429) and attempt < self.MAX_RETRIES:
+                    if rate_limited:
+                        self._pause_sends(backoff)
+                    else:
+                        time.sleep(backoff)
+                    backoff = min(backoff * 2, self.MAX_BACKOFF)
+                    continue
+                return False, f"Failed to send SMS: {_TWILIO_ERROR_MESSAGES.get(e.code, str(e))}"
+            except Exception as e:
+                return False, f"Failed to send SMS: {str(e)}"
+    
+    def _acquire_send_token(self):
+        """Block until the token bucket has a send available."""
+        while True:
+            with self._rate_lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    elapsed = now - self._tokens_at
+                    self._tokens = min(self.SEND_BURST, self._tokens + elapsed * self.SEND_RATE)
+                    self._tokens_at = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.SEND_RATE
+            time.sleep(wait)
+    
+    def _pause_sends(self, delay):
+        """Hold back all rate-limited sends for delay seconds after Twilio throttles us."""
+        with self._rate_lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            # Resume with a single send rather than a full burst
+            self._tokens = 1.0
+            self._tokens_at = self._paused_until
     
     def send_risk_alert(self, phone_number, member_id, risk_level, days_to_churn):
         """Send a risk alert SMS for a specific member."""
-        message = f"🚨 SIMLANE ALERT: Member {member_id} is at {risk_level} risk of churning in {days_to_churn} days. Take action now!"
-        return self.send_sms(phone_number, message)
+        message = _RISK_MSG_TMPL(mid=member_id, rl=risk_level, d=days_to_churn)
+        return self.send_sms(phone_number, message, rate_limited=True)
+    
+    def send_bulk_risk_alerts(self, phone_number, alerts):
+        """Send risk alerts concurrently; alerts are (member_id, risk_level, days_to_churn) tuples."""
+        if not self._executor:
+            return [self.send_risk_alert(phone_number, *alert) for alert in alerts]
+        futures = [
+            self._executor.submit(self.send_risk_alert, phone_number, *alert)
+            for alert in alerts
+        ]
+        return [future.result() for future in as_completed(futures)]
     
     def send_test_message(self, phone_number):
         """Send a test SMS message."""
-        message = "🎯 Simlane.ai Test Message: Your SMS notifications are working correctly!"
-        return self.send_sms(phone_number, message)
+        return self.send_sms(phone_number, _TEST_MSG)
 
-sms_manager = SMSManager()
+@st.cache_resource
+def get_sms_manager():
+    """Return the SMS manager shared across sessions and reruns."""
+    return SMSManager()
 
 # ============================================================================
 # AUTHENTICATION SYSTEM
 # ============================================================================
 
-class AuthManager:
-    def __init__(self):
-        self.users = {
-            "admin": {
-                "password_hash": bcrypt.hashpw("simlane2025".encode(), bcrypt.gensalt()),
-                "role": "admin",
-                "name": "Admin User"
-            },
-            "analyst": {
-                "password_hash": bcrypt.hashpw("analyst123".encode(), bcrypt.gensalt()), 
-                "role": "analyst",
-                "name": "Data Analyst"
-            },
-            "executive": {
-                "password_hash": bcrypt.hashpw("executive456".encode(), bcrypt.gensalt()),
-                "role": "executive", 
-                "name": "Executive User"
-            }
+@functools.lru_cache(maxsize=1)
+def _get_users_db():
+    """Build the demo user table on first use."""
+    # Demo password hashes are precomputed with bcrypt.hashpw (cost 12) so
+    # that no hashing happens at startup; login still verifies with bcrypt.
+    return {
+        "admin": {
+            "password_hash": b"$2b$12$xHCJAfscb6R6JtvIJzAP1.wiS95EbOKXXQwABTZ0BxsIrIAf3eQfi",
+            "role": "admin",
+            "name": "Admin User"
+        },
+        "analyst": {
+            "password_hash": b"$2b$12$4VKLo44f5VuDJdos7.AbmuhrpJH3622Mw4tf1W51liSeXUwnKf.bi",
+            "role": "analyst",
+            "name": "Data Analyst"
+        },
+        "executive": {
+            "password_hash": b"$2b$12$xv6kGyZIXo/ghEeM23TMFeXx/A5mqCIIW9VI9whwR5NwrPtFppYci",
+            "role": "executive", 
+            "name": "Executive User"
         }
+    }
+
+class AuthManager:
+    @property
+    def users(self):
+        return _get_users_db()
     
     def authenticate(self, username, password):
+        import bcrypt
+        import jwt
+        
         if username in self.users:
             user = self.users[username]
             if bcrypt.checkpw(password.encode(), user["password_hash"]):
@@ -287,104 +403,209 @@ class AuthManager:
         return False
     
     def check_auth(self):
-        if 'authenticated' not in st.session_state:
-            return False
         return st.session_state.authenticated
     
     def logout(self):
-        for key in ['auth_token', 'user', 'username', 'authenticated']:
-            if key in st.session_state:
-                del st.session_state[key]
+        for key in ('auth_token', 'user', 'username', 'authenticated'):
+            st.session_state.pop(key, None)
 
-auth_manager = AuthManager()
+@st.cache_resource
+def get_auth_manager():
+    """Return the auth manager shared across sessions and reruns."""
+    return AuthManager()
 
 # ============================================================================
 # DATA LOADING & PROCESSING
 # ============================================================================
 
-@st.cache_data
+# Risk categories ordered from most to least urgent
+RISK_CATEGORIES = ['IMMEDIATE', 'HIGH', 'MEDIUM', 'LOW']
+
+RISK_COLORS = {
+    'IMMEDIATE': '#FF6B35',
+    'HIGH': '#F59E0B',
+    'MEDIUM': '#0066CC',
+    'LOW': '#00CC88'
+}
+RISK_COLOR_SEQUENCE = [RISK_COLORS[category] for category in RISK_CATEGORIES]
+
+@st.cache_data(persist="disk", show_spinner=False)
 def load_sample_data():
-    """Load sample data for the dashboard."""
-    np.random.seed(42)
+    """Load sample data for the dashboard, along with its precomputed aggregates."""
+    # Local generator so the fixed seed never touches global NumPy state
+    rng = np.random.default_rng(42)
     
     # Generate sample member data
     n_members = 500
-    member_ids = [f'M{i:04d}' for i in range(1, n_members + 1)]
+    member_ids = np.char.add('M', np.char.zfill(np.arange(1, n_members + 1).astype(str), 4))
+    
+    # Draw group codes directly instead of building an object array of labels
+    n_groups = 20
+    group_ids = pd.Categorical.from_codes(
+        rng.integers(0, n_groups, n_members, dtype=np.int8),
+        categories=[f'G{i}' for i in range(1, n_groups + 1)]
+    )
     
     data = pd.DataFrame({
         'member_id': member_ids,
-        'group_id': [f'G{np.random.randint(1, 21)}' for _ in range(n_members)],
-        'status': np.random.choice(['active', 'cancelled'], n_members, p=[0.72, 0.28]),
-        'cluster': np.random.choice([0, 1, 2, 3], n_members, p=[0.25, 0.30, 0.20, 0.25]),
-        'pets_covered': np.random.choice([1, 2, 3, 4], n_members, p=[0.4, 0.3, 0.2, 0.1]),
-        'virtual_care_visits': np.random.poisson(2.5, n_members),
-        'tenure_days': np.random.exponential(300, n_members).astype(int),
-        'estimated_days_to_churn': np.random.exponential(180, n_members).astype(int),
-        'monthly_premium': np.random.normal(85, 20, n_members).round(2),
-        'lifetime_value': np.random.normal(1250, 300, n_members).round(2)
+        'group_id': group_ids,
+        'status': rng.choice(['active', 'cancelled'], n_members, p=[0.72, 0.28]),
+        'cluster': rng.choice([0, 1, 2, 3], n_members, p=[0.25, 0.30, 0.20, 0.25]),
+        'pets_covered': rng.choice([1, 2, 3, 4], n_members, p=[0.4, 0.3, 0.2, 0.1]),
+        'virtual_care_visits': rng.poisson(2.5, n_members),
+        'tenure_days': rng.exponential(300, n_members).astype(int),
+        'estimated_days_to_churn': rng.exponential(180, n_members).astype(int),
+        'monthly_premium': rng.normal(85, 20, n_members).round(2),
+        'lifetime_value': rng.normal(1250, 300, n_members).round(2)
     })
     
-    # Add risk categories
-    def categorize_risk(days):
-        if days <= 30:
-            return "IMMEDIATE"
-        elif days <= 90:
-            return "HIGH" 
-        elif days <= 180:
-            return "MEDIUM"
-        else:
-            return "LOW"
-    
-    data['risk_category'] = data['estimated_days_to_churn'].apply(categorize_risk)
+    # Add risk categories: <=30, <=90, <=180 and >180 days to churn
+    data['risk_category'] = pd.Categorical.from_codes(
+        np.digitize(data['estimated_days_to_churn'], [30, 90, 180], right=True),
+        categories=RISK_CATEGORIES,
+        ordered=True
+    )
     
     # Add industry and location data
     industries = ['Technology', 'Healthcare', 'Finance', 'Retail', 'Manufacturing']
     locations = ['New York', 'California', 'Texas', 'Florida', 'Illinois']
     
-    data['industry'] = np.random.choice(industries, n_members)
-    data['location'] = np.random.choice(locations, n_members)
+    data['industry'] = rng.choice(industries, n_members)
+    data['location'] = rng.choice(locations, n_members)
+    
+    # Narrow dtypes (Arrow-backed IDs, categorical labels, small ints) to cut memory and speed up aggregations
+    data = data.astype({
+        'member_id': 'string[pyarrow]',
+        'status': 'category',
+        'industry': 'category',
+        'location': 'category',
+        'cluster': 'int8',
+        'pets_covered': 'int8',
+        'virtual_care_visits': 'int16',
+        'tenure_days': 'int32',
+        'estimated_days_to_churn': 'int16'
+    })
     
-    return data
+    # Aggregates are cached with the data so reruns never re-hash the frame for them
+    return data, compute_aggregates(data)
 
 @st.cache_data
 def get_cluster_summary(data):
     """Generate cluster summary statistics."""
-    summary = data.groupby('cluster').agg({
+    summary = data.assign(cancelled=data['status'] == 'cancelled').groupby('cluster').agg({
         'member_id': 'count',
         'pets_covered': 'mean',
         'tenure_days': 'mean',
         'virtual_care_visits': 'mean',
         'monthly_premium': 'mean',
         'lifetime_value': 'mean',
-        'status': lambda x: (x == 'cancelled').mean()
+        'cancelled': 'mean'
     }).round(2)
     
     summary.columns = ['Size', 'Avg_Pets', 'Avg_Tenure', 'Avg_Visits', 'Avg_Premium', 'Avg_LTV', 'Churn_Rate']
     return summary
 
+def at_risk_mask(data):
+    """Boolean mask of members in the IMMEDIATE or HIGH risk categories."""
+    codes = data['risk_category'].cat.codes.to_numpy()
+    # code -1 marks a missing category, which is not at risk
+    return (codes >= 0) & (codes <= RISK_CATEGORIES.index('HIGH'))
+
+def compute_risk_counts(data):
+    """Count members in each risk category."""
+    codes = data['risk_category'].cat.codes.to_numpy()
+    counts = np.bincount(codes[codes >= 0], minlength=len(RISK_CATEGORIES))
+    return dict(zip(RISK_CATEGORIES, counts.tolist()))
+
+def compute_dashboard_kpis(data, risk_counts):
+    """Compute the quick-stat KPIs shown in the sidebar."""
+    return {
+        'total_members': len(data),
+        'at_risk': risk_counts['IMMEDIATE'] + risk_counts['HIGH'],
+        'churn_rate': (data['status'] == 'cancelled').mean()
+    }
+
+def get_active_churn_days(data):
+    """Days to predicted churn for active members."""
+    active_mask = data['status'].eq('active').to_numpy()
+    return data['estimated_days_to_churn'].to_numpy()[active_mask]
+
+def get_high_risk_members(data):
+    """At-risk members sorted by days to predicted churn, soonest first."""
+    return data[at_risk_mask(data)].sort_values('estimated_days_to_churn').reset_index(drop=True)
+
+def compute_aggregates(data):
+    """Reduce the member data to the counts, KPIs and slices the pages render."""
+    risk_counts = compute_risk_counts(data)
+    return {
+        'risk_counts': risk_counts,
+        'kpis': compute_dashboard_kpis(data, risk_counts),
+        'active_churn_days': get_active_churn_days(data),
+        'high_risk_members': get_high_risk_members(data)
+    }
+
+def _optimize_dtypes(df):
+    """Narrow integer columns and turn repetitive string columns into categories."""
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_string_dtype(series) and series.nunique() < len(series) * 0.5:
+            df[col] = series.astype('category')
+    # float columns stay float64: float32 cannot hold currency values to the cent
+    return df
+
+def _has_binary_columns(df):
+    """Whether any column was read as Arrow binary rather than text."""
+    import pyarrow as pa
+    return any(
+        isinstance(dtype, pd.ArrowDtype)
+        and (pa.types.is_binary(dtype.pyarrow_dtype) or pa.types.is_large_binary(dtype.pyarrow_dtype))
+        for dtype in df.dtypes
+    )
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def parse_uploaded_csv(file_bytes):
+    """Parse uploaded CSV bytes, preferring the multi-threaded pyarrow engine."""
+    buffer = io.BytesIO(file_bytes)
+    try:
+        df = pd.read_csv(buffer, engine='pyarrow', dtype_backend='pyarrow')
+    except ValueError:
+        # pyarrow rejects some irregular files that the C parser can still read
+        df = None
+    if df is None or _has_binary_columns(df):
+        # pyarrow loads invalid UTF-8 as raw bytes; the C parser raises on it instead
+        buffer.seek(0)
+        df = pd.read_csv(buffer, engine='c', encoding='utf-8', low_memory=False, cache_dates=True)
+    return _optimize_dtypes(df)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def convert_df_to_csv(df):
+    """Serialize a dataframe to UTF-8 CSV bytes for download."""
+    # Encoding straight into bytes avoids holding a str copy alongside the result
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, encoding='utf-8')
+    return buffer.getvalue()
+
 # ============================================================================
 # VISUALIZATION FUNCTIONS
 # ============================================================================
 
-def create_professional_header(title, subtitle):
-    """Create a professional header section."""
-    st.markdown(f"""
+@functools.lru_cache(maxsize=32)
+def _render_header(title, subtitle):
+    """Render the HTML for a page header."""
+    return f"""
     <div class="main-header">
-        <h1>🎯 {title}</h1>
-        <p>{subtitle}</p>
+        <h1>🎯 {html.escape(title)}</h1>
+        <p>{html.escape(subtitle)}</p>
     </div>
-    """, unsafe_allow_html=True)
+    """
 
-def create_metric_card(label, value, change=None, icon="📊"):
-    """Create a professional metric card."""
-    change_class = ""
-    change_text = ""
-    
-    if change:
-        change_class = "positive" if change.startswith("+") or change.startswith("↑") else "negative"
-        change_text = f'<p class="metric-change {change_class}">{change}</p>'
-    
-    return f"""
+def create_professional_header(title, subtitle):
+    """Create a professional header section."""
+    st.html(_render_header(title, subtitle))
+
+_METRIC_CARD_TMPL = """
     <div class="metric-card">
         <p class="metric-label">{icon} {label}</p>
         <h2 class="metric-value">{value}</h2>
@@ -392,6 +613,24 @@ def create_metric_card(label, value, change=None, icon="📊"):
     </div>
     """
 
+_METRIC_CHANGE_TMPL = '<p class="metric-change {change_class}">{change}</p>'
+
+@functools.lru_cache(maxsize=128)
+def create_metric_card(label, value, change=None, icon="📊"):
+    """Create a professional metric card."""
+    change_text = ""
+    
+    if change:
+        change_class = "positive" if change.startswith(("+", "↑")) else "negative"
+        change_text = _METRIC_CHANGE_TMPL.format(change_class=change_class, change=html.escape(change))
+    
+    return _METRIC_CARD_TMPL.format(
+        icon=html.escape(icon),
+        label=html.escape(label),
+        value=html.escape(str(value)),
+        change_text=change_text
+    )
+
 def create_alert_box(message, alert_type="info"):
     """Create a professional alert box."""
     icons = {
@@ -402,21 +641,23 @@ def create_alert_box(message, alert_type="info"):
     }
     
     return f"""
-    <div class="alert alert-{alert_type}">
-        {icons.get(alert_type, "ℹ️")} {message}
+    <div class="alert alert-{html.escape(alert_type)}">
+        {icons.get(alert_type, "ℹ️")} {html.escape(message)}
     </div>
     """
 
+_LOGIN_HEADER_HTML = """
+<div class="login-container">
+    <div class="login-header">
+        <h1>Simlane.ai</h1>
+        <p>Analytics Platform</p>
+    </div>
+</div>
+"""
+
 def show_login_page():
     """Display the login page."""
-    st.markdown("""
-    <div class="login-container">
-        <div class="login-header">
-            <h1>Simlane.ai</h1>
-            <p>Analytics Platform</p>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.html(_LOGIN_HEADER_HTML)
     
     with st.form("login_form"):
         st.subheader("🔐 Secure Login")
@@ -425,9 +666,7 @@ def show_login_page():
         submitted = st.form_submit_button("Sign In", use_container_width=True)
         
         if submitted:
-            if auth_manager.authenticate(username, password):
-                st.success("✅ Login successful! Redirecting...")
-                time.sleep(1)
+            if get_auth_manager().authenticate(username, password):
                 st.rerun()
             else:
                 st.error("❌ Invalid username or password")
@@ -448,39 +687,82 @@ def show_login_page():
         - Password: `executive456`
         """)
 
-def create_risk_dashboard(data):
-    """Create risk analysis dashboard."""
+@st.cache_resource(max_entries=16)
+def create_risk_dashboard(risk_counts, active_churn_days):
+    """Create risk analysis dashboard from precomputed risk counts and active members' days to churn."""
+    import plotly.graph_objects as go
     
     # Risk distribution
-    risk_counts = data['risk_category'].value_counts()
-    fig_risk = px.bar(
-        x=risk_counts.index,
-        y=risk_counts.values,
+    fig_risk = go.Figure(go.Bar(
+        x=RISK_CATEGORIES,
+        y=[risk_counts[category] for category in RISK_CATEGORIES],
+        marker_color=RISK_COLOR_SEQUENCE
+    ))
+    fig_risk.update_layout(
         title="Member Risk Distribution",
-        labels={'x': 'Risk Category', 'y': 'Number of Members'},
-        color=risk_counts.index,
-        color_discrete_map={
-            'IMMEDIATE': '#FF6B35',
-            'HIGH': '#F59E0B', 
-            'MEDIUM': '#0066CC',
-            'LOW': '#00CC88'
-        }
+        xaxis_title="Risk Category",
+        yaxis_title="Number of Members",
+        height=400
     )
-    fig_risk.update_layout(height=400)
     
     # Timeline distribution
-    fig_timeline = px.histogram(
-        data[data['status'] == 'active'], 
-        x='estimated_days_to_churn',
-        nbins=30,
+    fig_timeline = go.Figure(go.Histogram(
+        x=active_churn_days,
+        nbinsx=30,
+        marker_color='#0066CC'
+    ))
+    fig_timeline.update_layout(
         title="Time to Predicted Churn Distribution",
-        color_discrete_sequence=['#0066CC']
+        xaxis_title="estimated_days_to_churn",
+        yaxis_title="count",
+        height=400
     )
-    fig_timeline.update_layout(height=400)
     
     return fig_risk, fig_timeline
 
-def show_churn_predictions(data):
+@st.cache_resource(max_entries=16)
+def create_segment_scatter(data):
+    """Create the usage-vs-tenure scatter for customer segments."""
+    import plotly.express as px
+    
+    fig_scatter = px.scatter(
+        data, 
+        x='tenure_days', 
+        y='virtual_care_visits',
+        color='cluster',
+        size='lifetime_value',
+        hover_data=['member_id', 'risk_category'],
+        title="Usage vs Tenure by Segment",
+        labels={'tenure_days': 'Tenure (Days)', 'virtual_care_visits': 'Virtual Care Visits'},
+        color_discrete_sequence=['#0066CC', '#00B8A3', '#FF6B35', '#00CC88'],
+        render_mode='webgl'
+    )
+    fig_scatter.update_layout(height=500)
+    
+    return fig_scatter
+
+@st.fragment
+def bulk_alert_fragment(high_risk_members):
+    """SMS bulk-alert panel, rerun on its own without redrawing the page."""
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.write("Members at immediate risk with SMS alert option")
+    with col2:
+        if st.button("📱 Send Bulk Alerts", use_container_width=True):
+            if st.session_state.alert_phone:
+                immediate_members = high_risk_members[high_risk_members['risk_category'] == 'IMMEDIATE'].head(5)
+                with st.spinner("Sending SMS alerts..."):
+                    alerts = immediate_members[['member_id', 'risk_category', 'estimated_days_to_churn']].itertuples(index=False, name=None)
+                    results = get_sms_manager().send_bulk_risk_alerts(st.session_state.alert_phone, alerts)
+                    success_count = sum(success for success, _ in results)
+                    if success_count > 0:
+                        st.success(f"✅ Sent {success_count} SMS alerts successfully!")
+                    else:
+                        st.error("Failed to send alerts. Check your Twilio configuration.")
+            else:
+                st.warning("Please configure SMS settings first.")
+
+def show_churn_predictions(aggregates, date_stamp):
     """Churn predictions page."""
     create_professional_header(
         "Churn Predictions", 
@@ -490,45 +772,46 @@ def show_churn_predictions(data):
     # Risk metrics
     col1, col2, col3, col4 = st.columns(4)
     
-    immediate_risk = len(data[data['risk_category'] == 'IMMEDIATE'])
-    high_risk = len(data[data['risk_category'] == 'HIGH'])
-    medium_risk = len(data[data['risk_category'] == 'MEDIUM'])
-    low_risk = len(data[data['risk_category'] == 'LOW'])
+    risk_counts = aggregates['risk_counts']
+    immediate_risk = risk_counts['IMMEDIATE']
+    high_risk = risk_counts['HIGH']
+    medium_risk = risk_counts['MEDIUM']
+    low_risk = risk_counts['LOW']
     
     with col1:
-        st.markdown(create_metric_card(
+        st.html(create_metric_card(
             "Immediate Risk", 
             f"{immediate_risk}", 
             "Next 30 days",
             "🚨"
-        ), unsafe_allow_html=True)
+        ))
     
     with col2:
-        st.markdown(create_metric_card(
+        st.html(create_metric_card(
             "High Risk", 
             f"{high_risk}", 
             "30-90 days",
             "⚠️"
-        ), unsafe_allow_html=True)
+        ))
     
     with col3:
-        st.markdown(create_metric_card(
+        st.html(create_metric_card(
             "Medium Risk", 
             f"{medium_risk}", 
             "90-180 days",
             "📊"
-        ), unsafe_allow_html=True)
+        ))
     
     with col4:
-        st.markdown(create_metric_card(
+        st.html(create_metric_card(
             "Low Risk", 
             f"{low_risk}", 
             ">180 days",
             "✅"
-        ), unsafe_allow_html=True)
+        ))
     
     # Risk visualization
-    fig_risk, fig_timeline = create_risk_dashboard(data)
+    fig_risk, fig_timeline = create_risk_dashboard(risk_counts, aggregates['active_churn_days'])
     
     col1, col2 = st.columns(2)
     with col1:
@@ -539,50 +822,31 @@ def show_churn_predictions(data):
     # High-risk members table with SMS alert option
     st.subheader("🎯 High-Priority Members")
     
-    high_risk_members = data[data['risk_category'].isin(['IMMEDIATE', 'HIGH'])].sort_values('estimated_days_to_churn')
+    high_risk_members = aggregates['high_risk_members']
     
     # Add SMS alert functionality if enabled
-    if 'sms_alerts_enabled' in st.session_state and st.session_state.sms_alerts_enabled:
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            st.write("Members at immediate risk with SMS alert option")
-        with col2:
-            if st.button("📱 Send Bulk Alerts", use_container_width=True):
-                if 'alert_phone' in st.session_state:
-                    immediate_members = high_risk_members[high_risk_members['risk_category'] == 'IMMEDIATE'].head(5)
-                    with st.spinner("Sending SMS alerts..."):
-                        success_count = 0
-                        for _, member in immediate_members.iterrows():
-                            success, msg = sms_manager.send_risk_alert(
-                                st.session_state.alert_phone,
-                                member['member_id'],
-                                member['risk_category'],
-                                member['estimated_days_to_churn']
-                            )
-                            if success:
-                                success_count += 1
-                        if success_count > 0:
-                            st.success(f"✅ Sent {success_count} SMS alerts successfully!")
-                        else:
-                            st.error("Failed to send alerts. Check your Twilio configuration.")
-                else:
-                    st.warning("Please configure SMS settings first.")
+    if st.session_state.sms_alerts_enabled:
+        bulk_alert_fragment(high_risk_members)
     
     display_columns = ['member_id', 'group_id', 'risk_category', 'estimated_days_to_churn', 
                       'tenure_days', 'virtual_care_visits', 'lifetime_value']
     
     st.dataframe(
         high_risk_members[display_columns].head(20),
+        column_config={
+            'lifetime_value': st.column_config.NumberColumn(format='$%.2f'),
+            'risk_category': st.column_config.TextColumn()
+        },
+        hide_index=True,
         use_container_width=True,
         height=400
     )
     
-    # Download option
-    csv = high_risk_members.to_csv(index=False)
+    # Download option - the CSV is only built when the button is clicked
     st.download_button(
         label="📥 Download High-Risk Members List",
-        data=csv,
-        file_name=f"high_risk_members_{datetime.now().strftime('%Y%m%d')}.csv",
+        data=lambda: convert_df_to_csv(high_risk_members),
+        file_name=f"high_risk_members_{date_stamp}.csv",
         mime='text/csv'
     )
 
@@ -600,33 +864,22 @@ def show_customer_segments(data, cluster_summary):
     
     with col1:
         highest_value_cluster = cluster_summary['Avg_LTV'].idxmax()
-        st.markdown(create_alert_box(
+        st.html(create_alert_box(
             f"Cluster {highest_value_cluster} has the highest average lifetime value at ${cluster_summary.loc[highest_value_cluster, 'Avg_LTV']:,.0f}",
             "success"
-        ), unsafe_allow_html=True)
+        ))
     
     with col2:
         highest_churn_cluster = cluster_summary['Churn_Rate'].idxmax()
-        st.markdown(create_alert_box(
+        st.html(create_alert_box(
             f"Cluster {highest_churn_cluster} has the highest churn rate at {cluster_summary.loc[highest_churn_cluster, 'Churn_Rate']*100:.1f}%",
             "warning"
-        ), unsafe_allow_html=True)
+        ))
     
     # Member engagement patterns (scatter plot only)
     st.subheader("📈 Member Engagement Patterns")
     
-    fig_scatter = px.scatter(
-        data, 
-        x='tenure_days', 
-        y='virtual_care_visits',
-        color='cluster',
-        size='lifetime_value',
-        hover_data=['member_id', 'risk_category'],
-        title="Usage vs Tenure by Segment",
-        labels={'tenure_days': 'Tenure (Days)', 'virtual_care_visits': 'Virtual Care Visits'},
-        color_discrete_sequence=['#0066CC', '#00B8A3', '#FF6B35', '#00CC88']
-    )
-    fig_scatter.update_layout(height=500)
+    fig_scatter = create_segment_scatter(data)
     
     st.plotly_chart(fig_scatter, use_container_width=True)
     
@@ -641,54 +894,102 @@ def show_customer_segments(data, cluster_summary):
     
     st.dataframe(display_summary, use_container_width=True)
 
-def show_settings():
-    """Settings page."""
-    create_professional_header(
-        "Settings & Configuration", 
-        "System settings, data management, and user preferences"
+# Option lists for the settings widgets
+_ROLE_OPTIONS = ('Admin', 'Analyst', 'Executive')
+_TIMEZONE_OPTIONS = ('EST', 'PST', 'CST', 'UTC')
+_DATE_FORMAT_OPTIONS = ('MM/DD/YYYY', 'DD/MM/YYYY', 'YYYY-MM-DD')
+_EMAIL_FREQUENCIES = ('Immediate', 'Daily Digest', 'Weekly Summary')
+_SMS_THRESHOLD_LEVELS = ('LOW', 'MEDIUM', 'HIGH', 'IMMEDIATE')
+_ALERT_TYPES = ('New High Risk Members', 'Churn Rate Changes', 'Segment Shifts', 'System Issues')
+_DASHBOARD_VIEWS = ('Churn Predictions', 'Customer Segments')
+_EXPORT_FORMATS = ('CSV', 'Excel', 'JSON')
+
+@st.fragment
+def data_management_fragment(data, date_stamp):
+    """Upload and export tab, rerun on its own as files are previewed and exported."""
+    st.subheader("📥 Data Upload")
+    
+    uploaded_file = st.file_uploader(
+        "Upload new member data (CSV format)",
+        type=['csv'],
+        help="Upload a CSV file with member data to update the analytics"
     )
     
-    tab1, tab2, tab3 = st.tabs(["📊 Data Management", "👤 User Settings", "🔧 System Config"])
+    if uploaded_file is not None:
+        try:
+            new_data = parse_uploaded_csv(uploaded_file.getvalue())
+            st.success(f"✅ Successfully uploaded {len(new_data)} records")
+            st.dataframe(new_data.head(), use_container_width=True)
+            
+            if st.button("🔄 Process Data"):
+                st.success("✅ Data processed successfully! Dashboard will update automatically.")
+                
+        except Exception as e:
+            st.error(f"❌ Error processing file: {str(e)}")
     
-    with tab1:
-        st.subheader("📥 Data Upload")
+    st.subheader("🗂️ Data Export")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("📊 Export Full Dataset", use_container_width=True):
+            csv = convert_df_to_csv(data)
+            st.download_button(
+                label="📥 Download CSV",
+                data=csv,
+                file_name=f"member_data_{date_stamp}.csv",
+                mime="text/csv"
+            )
+    
+    with col2:
+        if st.button("📈 Export Analytics Report", use_container_width=True):
+            st.info("📊 Generating comprehensive analytics report...")
+
+@st.fragment
+def system_config_fragment():
+    """System configuration tab; inputs are batched in a form and applied together."""
+    with st.form("system_config_form"):
+        st.subheader("⚙️ System Configuration")
         
-        uploaded_file = st.file_uploader(
-            "Upload new member data (CSV format)",
-            type=['csv'],
-            help="Upload a CSV file with member data to update the analytics"
-        )
+        col1, col2 = st.columns(2)
         
-        if uploaded_file is not None:
-            try:
-                new_data = pd.read_csv(uploaded_file)
-                st.success(f"✅ Successfully uploaded {len(new_data)} records")
-                st.dataframe(new_data.head(), use_container_width=True)
-                
-                if st.button("🔄 Process Data"):
-                    st.success("✅ Data processed successfully! Dashboard will update automatically.")
-                    
-            except Exception as e:
-                st.error(f"❌ Error processing file: {str(e)}")
+        with col1:
+            st.number_input("Data Refresh Interval (hours)", value=24, min_value=1)
+            st.number_input("High Risk Alert Threshold (days)", value=30, min_value=1, max_value=90)
+            st.selectbox("Default Dashboard View", options=_DASHBOARD_VIEWS, index=0)
         
-        st.subheader("🗂️ Data Export")
+        with col2:
+            st.checkbox("Auto-generate Weekly Reports", value=True)
+            st.checkbox("Enable Advanced Analytics", value=True)
+            st.selectbox("Export Format", options=_EXPORT_FORMATS, index=0)
         
-        col1, col2 = st.columns(2)
+        st.subheader("🎯 Risk Thresholds")
         
-        with col1:
-            if st.button("📊 Export Full Dataset", use_container_width=True):
-                data = load_sample_data()
-                csv = data.to_csv(index=False)
-                st.download_button(
-                    label="📥 Download CSV",
-                    data=csv,
-                    file_name=f"member_data_{datetime.now().strftime('%Y%m%d')}.csv",
-                    mime="text/csv"
-                )
+        col1, col2, col3, col4 = st.columns(4)
         
+        with col1:
+            st.number_input("Immediate Risk (days)", value=30, min_value=1, max_value=60)
         with col2:
-            if st.button("📈 Export Analytics Report", use_container_width=True):
-                st.info("📊 Generating comprehensive analytics report...")
+            st.number_input("High Risk (days)", value=90, min_value=31, max_value=120)
+        with col3:
+            st.number_input("Medium Risk (days)", value=180, min_value=91, max_value=365)
+        with col4:
+            st.number_input("Low Risk (days)", value=365, min_value=181)
+        
+        if st.form_submit_button("🔄 Apply Configuration", use_container_width=True):
+            st.success("✅ Configuration updated successfully!")
+
+def show_settings(data, date_stamp):
+    """Settings page."""
+    create_professional_header(
+        "Settings & Configuration", 
+        "System settings, data management, and user preferences"
+    )
+    
+    tab1, tab2, tab3 = st.tabs(["📊 Data Management", "👤 User Settings", "🔧 System Config"])
+    
+    with tab1:
+        data_management_fragment(data, date_stamp)
     
     with tab2:
         st.subheader("👤 User Profile")
@@ -701,10 +1002,10 @@ def show_settings():
             st.text_input("Phone Number", value="+1 (555) 123-4567", help="For SMS notifications")
         
         with col2:
-            st.selectbox("Role", options=['Admin', 'Analyst', 'Executive'], 
+            st.selectbox("Role", options=_ROLE_OPTIONS, 
                         index=0 if st.session_state.user['role'] == 'admin' else 1)
-            st.selectbox("Timezone", options=['EST', 'PST', 'CST', 'UTC'], index=0)
-            st.selectbox("Date Format", options=['MM/DD/YYYY', 'DD/MM/YYYY', 'YYYY-MM-DD'], index=0)
+            st.selectbox("Timezone", options=_TIMEZONE_OPTIONS, index=0)
+            st.selectbox("Date Format", options=_DATE_FORMAT_OPTIONS, index=0)
         
         st.subheader("🔔 Notification Preferences")
         
@@ -716,7 +1017,7 @@ def show_settings():
                 alert_email = st.text_input("Alert Email", value="alerts@simlane.ai", 
                                           help="Where to send email alerts")
                 email_frequency = st.selectbox("Email Frequency", 
-                                             options=["Immediate", "Daily Digest", "Weekly Summary"])
+                                             options=_EMAIL_FREQUENCIES)
         
         with col2:
             sms_alerts = st.checkbox("SMS Alerts", value=False)
@@ -725,7 +1026,7 @@ def show_settings():
                                           help="Where to send SMS alerts")
                 sms_threshold = st.select_slider(
                     "SMS Alert Threshold",
-                    options=["LOW", "MEDIUM", "HIGH", "IMMEDIATE"],
+                    options=_SMS_THRESHOLD_LEVELS,
                     value="HIGH",
                     help="Only send SMS for risks at or above this level"
                 )
@@ -738,7 +1039,7 @@ def show_settings():
                 if st.button("📱 Send Test SMS", use_container_width=True):
                     if alert_phone:
                         with st.spinner("Sending test message..."):
-                            success, message = sms_manager.send_test_message(alert_phone)
+                            success, message = get_sms_manager().send_test_message(alert_phone)
                             if success:
                                 st.success(message)
                             else:
@@ -747,26 +1048,7 @@ def show_settings():
                                     st.info("💡 To enable SMS, install Twilio: `pip install twilio`")
                                 else:
                                     with st.expander("🔧 Twilio Configuration Help"):
-                                        st.markdown("""
-                                        **To configure Twilio:**
-                                        
-                                        1. Create a `.streamlit/secrets.toml` file:
-                                        ```toml
-                                        [twilio]
-                                        account_sid = "your-account-sid"
-                                        auth_token = "your-auth-token"
-                                        from_number = "+1234567890"
-                                        ```
-                                        
-                                        2. Or set environment variables:
-                                        ```bash
-                                        export TWILIO_ACCOUNT_SID="your-sid"
-                                        export TWILIO_AUTH_TOKEN="your-token"
-                                        export TWILIO_FROM_NUMBER="+1234567890"
-                                        ```
-                                        
-                                        3. Get your credentials from [Twilio Console](https://console.twilio.com)
-                                        """)
+                                        st.markdown(_TWILIO_HELP_MD)
                     else:
                         st.warning("Please enter a phone number first.")
             else:
@@ -775,7 +1057,7 @@ def show_settings():
         if email_alerts or sms_alerts:
             st.multiselect(
                 "Alert Types",
-                options=["New High Risk Members", "Churn Rate Changes", "Segment Shifts", "System Issues"],
+                options=_ALERT_TYPES,
                 default=["New High Risk Members", "Churn Rate Changes"]
             )
         
@@ -783,71 +1065,65 @@ def show_settings():
             st.success("✅ Settings saved successfully!")
     
     with tab3:
-        st.subheader("⚙️ System Configuration")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.number_input("Data Refresh Interval (hours)", value=24, min_value=1)
-            st.number_input("High Risk Alert Threshold (days)", value=30, min_value=1, max_value=90)
-            st.selectbox("Default Dashboard View", options=['Churn Predictions', 'Customer Segments'], index=0)
-        
-        with col2:
-            st.checkbox("Auto-generate Weekly Reports", value=True)
-            st.checkbox("Enable Advanced Analytics", value=True)
-            st.selectbox("Export Format", options=['CSV', 'Excel', 'JSON'], index=0)
-        
-        st.subheader("🎯 Risk Thresholds")
-        
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.number_input("Immediate Risk (days)", value=30, min_value=1, max_value=60)
-        with col2:
-            st.number_input("High Risk (days)", value=90, min_value=31, max_value=120)
-        with col3:
-            st.number_input("Medium Risk (days)", value=180, min_value=91, max_value=365)
-        with col4:
-            st.number_input("Low Risk (days)", value=365, min_value=181)
-        
-        if st.button("🔄 Apply Configuration", use_container_width=True):
-            st.success("✅ Configuration updated successfully!")
+        system_config_fragment()
 
 # ============================================================================
 # MAIN APPLICATION
 # ============================================================================
 
+_NAV_PAGES = ('⚠️ Churn Predictions', '👥 Customer Segments', '⚙️ Settings')
+
+_SIDEBAR_WELCOME_TMPL = """
+<div style="text-align: center; padding: 1rem; margin-bottom: 2rem; 
+            background: linear-gradient(135deg, #0066CC, #00B8A3); 
+            border-radius: 10px; color: white;">
+    <h3 style="margin: 0;">Welcome!</h3>
+    <p style="margin: 0.5rem 0 0 0;">{name}</p>
+</div>
+"""
+
+_FOOTER_HTML = """
+<div style="text-align: center; color: #6B7280; padding: 1rem;">
+    <p>© 2025 Simlane.ai Analytics Platform | Secure Business Intelligence</p>
+</div>
+"""
+
+# Seeded once per run so pages can read these keys without membership checks
+_SESSION_DEFAULTS = {
+    'authenticated': False,
+    'sms_alerts_enabled': False,
+    'alert_phone': '',
+}
+
+def _ensure_state():
+    """Seed any missing session state keys with their defaults."""
+    for key, value in _SESSION_DEFAULTS.items():
+        st.session_state.setdefault(key, value)
+
 def main():
     """Main application function."""
     
+    _ensure_state()
+    st.html(APP_CSS)
+    
     # Check authentication
-    if not auth_manager.check_auth():
+    if not get_auth_manager().check_auth():
         show_login_page()
         return
     
     # Load data
-    data = load_sample_data()
+    data, aggregates = load_sample_data()
     cluster_summary = get_cluster_summary(data)
+    date_stamp = datetime.now().strftime('%Y%m%d')
     
     # Sidebar navigation
     with st.sidebar:
-        st.markdown(f"""
-        <div style="text-align: center; padding: 1rem; margin-bottom: 2rem; 
-                    background: linear-gradient(135deg, #0066CC, #00B8A3); 
-                    border-radius: 10px; color: white;">
-            <h3 style="margin: 0;">Welcome!</h3>
-            <p style="margin: 0.5rem 0 0 0;">{st.session_state.user['name']}</p>
-        </div>
-        """, unsafe_allow_html=True)
+        st.html(_SIDEBAR_WELCOME_TMPL.format(name=html.escape(st.session_state.user['name'])))
         
         # Navigation menu
         page = st.radio(
             "📍 Navigation",
-            options=[
-                "⚠️ Churn Predictions",
-                "👥 Customer Segments",
-                "⚙️ Settings"
-            ],
+            options=_NAV_PAGES,
             index=0
         )
         
@@ -855,36 +1131,30 @@ def main():
         
         # Quick stats
         st.markdown("**📊 Quick Stats**")
-        total_members = len(data)
-        at_risk = len(data[data['risk_category'].isin(['IMMEDIATE', 'HIGH'])])
-        churn_rate = (data['status'] == 'cancelled').mean()
+        kpis = aggregates['kpis']
         
-        st.metric("Total Members", f"{total_members:,}")
-        st.metric("At Risk", f"{at_risk:,}")
-        st.metric("Churn Rate", f"{churn_rate:.1%}")
+        st.metric("Total Members", f"{kpis['total_members']:,}")
+        st.metric("At Risk", f"{kpis['at_risk']:,}")
+        st.metric("Churn Rate", f"{kpis['churn_rate']:.1%}")
         
         st.markdown("---")
         
         # Logout button
         if st.button("🚪 Logout", use_container_width=True):
-            auth_manager.logout()
+            get_auth_manager().logout()
             st.rerun()
     
     # Main content area
     if page == "⚠️ Churn Predictions":
-        show_churn_predictions(data)
+        show_churn_predictions(aggregates, date_stamp)
     elif page == "👥 Customer Segments":
         show_customer_segments(data, cluster_summary)
     elif page == "⚙️ Settings":
-        show_settings()
+        show_settings(data, date_stamp)
     
     # Clean footer - updated for 2025
     st.markdown("---")
-    st.markdown("""
-    <div style="text-align: center; color: #6B7280; padding: 1rem;">
-        <p>© 2025 Simlane.ai Analytics Platform | Secure Business Intelligence</p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.html(_FOOTER_HTML)
 
 # ============================================================================
 # RUN APPLICATION